@@ -0,0 +1,131 @@
+// clientside callbacks of the dashboard, registered in `source_code.py`
+// (Dash serves this folder automatically)
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    spice: {
+        // Tab 1 visualization 1: World Map of the selected metric in selected year,
+        // built from the rows and colour scale bounds of that year in `spice-store`
+        // (each row refers to its area's name and ISO-3 code by index)
+        update_global_map: function (metric, year, store, template) {
+            // keep the current map while a dropdown is cleared
+            if (!metric || !year || !(year in store.rows)) {
+                return window.dash_clientside.no_update;
+            }
+
+            const rows = store.rows[year];
+            const [cmin, cmax] = store.bounds[metric][year];
+            const layout = store.layout;
+
+            return {
+                data: [
+                    {
+                        type: "choropleth",
+                        geo: "geo",
+                        coloraxis: "coloraxis",
+                        locationmode: "ISO-3",
+                        locations: rows.index.map((i) => store.iso3[i]),
+                        z: rows[metric],
+                        customdata: rows.index.map((i) => store.areas[i]),
+                        name: "",
+                        hovertemplate:
+                            `Year=${year}<br>Area=%{customdata}<br>` +
+                            `${metric}=%{z}<extra></extra>`,
+                    },
+                ],
+                layout: {
+                    ...layout,
+                    template: template,
+                    coloraxis: {
+                        ...layout.coloraxis,
+                        cmin: cmin,
+                        cmax: cmax,
+                        colorbar: { ...layout.coloraxis.colorbar, title: { text: metric } },
+                    },
+                    title: {
+                        ...layout.title,
+                        text: `World Map of Spice ${metric} in ${year}`,
+                    },
+                },
+            };
+        },
+
+        // Tab 2 visualization 2: Bar chart showing continental total of the
+        // selected metric in the hovered year, looked up in `continent-agg-store`
+        update_continent_bar_chart: function (metric, hoverData, store, template) {
+            // No updates on the second chart if there is no hover data
+            if (!hoverData || !metric) {
+                throw window.dash_clientside.PreventUpdate;
+            }
+
+            const year = hoverData.points[0].x;
+            const totals = store.totals[metric][year];
+
+            return {
+                // one bar per continent, so that each gets its own colour
+                data: store.continents.map((continent, i) => ({
+                    type: "bar",
+                    orientation: "h",
+                    x: [totals[i]],
+                    y: [continent],
+                    name: continent,
+                    legendgroup: continent,
+                    marker: { opacity: 0.6 },
+                    hovertemplate: `Continent=%{y}<br>${metric}=%{x}<extra></extra>`,
+                })),
+                layout: {
+                    ...store.layout,
+                    template: template,
+                    xaxis: { ...store.layout.xaxis, title: { text: metric } },
+                    title: {
+                        ...store.layout.title,
+                        text: `Total Spice ${metric} in each continent in ${year}`,
+                    },
+                },
+            };
+        },
+
+        // Call back function of Tab 4: title, bar chart and market share table
+        // of the top 5 countries, looked up in `top5-store`
+        update_top5: function (metric, year, scope, store, template) {
+            const top5 = ((store.top5[metric] || {})[year] || {})[scope];
+            if (!top5) {
+                throw window.dash_clientside.PreventUpdate;
+            }
+            const names = top5.index.map((i) => store.areas[i]);
+
+            // Tab 4 visualization 1: Bar chart, in ascending order of the metric
+            // (a value of null would be put last, but only defensively: no entry
+            // of `top5-store` has one with the current data)
+            const order = [0, 1, 2, 3, 4].sort(function (i, j) {
+                const a = top5.values[i];
+                const b = top5.values[j];
+                return (a === null) - (b === null) || a - b;
+            });
+            const top5_bar_chart = {
+                data: [
+                    {
+                        type: "bar",
+                        orientation: "h",
+                        x: order.map((i) => top5.values[i]),
+                        y: order.map((i) => names[i]),
+                        name: "",
+                        hovertemplate: `${metric}=%{x}<br>Area=%{y}<extra></extra>`,
+                    },
+                ],
+                layout: {
+                    ...store.layout,
+                    template: template,
+                    xaxis: { ...store.layout.xaxis, title: { text: metric } },
+                },
+            };
+
+            return [
+                `Top 5 countries of ${metric} in ${year} within ${scope}`,
+                top5_bar_chart,
+                `Market Share of ${metric} of these 5 countries`,
+                ...names,
+                `${metric} Market Share`,
+                ...top5.shares,
+            ];
+        },
+    },
+});
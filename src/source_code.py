@@ -1,100 +1,460 @@
 # load python libraries
-from dash import dcc, html, Dash, dash_table, ctx, no_update
-from dash.dependencies import Output, Input
-from dash.exceptions import PreventUpdate
-import plotly.express as px
+from dash import dcc, html, Dash, dash_table, clientside_callback
+from dash.dependencies import Output, Input, State, ClientsideFunction
+import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 from dash_bootstrap_templates import load_figure_template
+from flask import Response, abort, request
 import dash_bootstrap_components as dbc
-import country_converter as coco
+import gzip
 import logging
+import os
+from functools import lru_cache
 import warnings
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-# read raw data
-data = pd.read_csv("data/data_raw.csv")
-# read reference table
-ref_table = pd.read_csv("data/country_code_conversion.csv")
-
-# clean relevant numeric columns in `data` and `ref_table`
-data["Area Code (M49)"] = (
-    data["Area Code (M49)"]
-    .astype(str)
-    .str.replace('"', "", regex=False)
-    .str.strip()
-    .astype("Int64")
-)
-ref_table["Numeric code"] = (
-    ref_table["Numeric code"]
-    .astype(str)
-    .str.replace('"', "", regex=False)
-    .str.strip()
-    .astype("Int64")
-)
-ref_table["Alpha-3 code"] = (
-    ref_table["Alpha-3 code"].astype(str).str.replace('"', "", regex=False).str.strip()
-)
-data["Year"] = data["Year"].astype(int)
+# raw inputs and the cached, cleaned data frame built from them
+RAW_DATA_PATH = "data/data_raw.csv"
+REF_TABLE_PATH = "data/country_code_conversion.csv"
+CLEAN_DATA_PATH = "data/data_clean.parquet"
 
-# fix inconsistency between raw data and reference table
-data.loc[data["Area"] == "Sudan", "Area Code (M49)"] = 736
+# the only raw csv columns the dashboard uses, with the types to parse them as:
+# text stays arrow-backed, while values are parsed straight into numpy floats,
+# since all the arithmetic and aggregation after loading runs on plain numpy
+# arrays and would otherwise need a conversion first
+RAW_DTYPES = {
+    "Area": "string[pyarrow]",
+    "Area Code (M49)": "string[pyarrow]",
+    "Year": "int16",
+    "Import": "float64",
+    "Export ": "float64",
+    "Production": "float64",
+    "Consumption": "float64",
+}
 
-# shorten a long area name
-data["Area"] = data["Area"].replace(
-    "United Kingdom of Great Britain and Northern Ireland", "UK and Northern Ireland"
-)
 
-# left join `data` and `ref_table` using each area's M49 code
-# so that latitude and longitude information can be included in `data`
-data = data.merge(
-    ref_table, how="left", left_on="Area Code (M49)", right_on="Numeric code"
-)
+# quotes and whitespace wrapped around values in the raw csv files
+_JUNK = '" \t\n'
 
-# use coco library to tell which continent each area is located in
-cc = coco.CountryConverter()
-logging.getLogger("country_converter").setLevel(logging.ERROR)
-data["Continent"] = cc.convert(
-    names=data["Area Code (M49)"], to="continent", src="UNnumeric"
-)
-data["Continent"] = data["Continent"].replace("not found", pd.NA)
 
-# filter out those area which cannot be matched with a continent
-data = data[data["Continent"].notna()]
-# select only relevant columns in `data`
-data = data[
-    [
-        "Area",
-        "Continent",  #'Latitude (average)', 'Longitude (average)',
-        "Alpha-3 code",
-        "Year",
-        "Import",
-        "Export ",
-        "Production",
-        "Consumption",
-        "Unit",
+# strip quotes/whitespace and parse the values as nullable integers
+def _clean_intish(s: pd.Series) -> pd.Series:
+    cleaned = s.astype(str).str.strip(_JUNK)
+    return pd.to_numeric(cleaned, errors="coerce").astype("Int64")
+
+
+# run the full cleaning pipeline on the raw csv files
+def _build_clean() -> pd.DataFrame:
+
+    # read raw data and reference table into arrow-backed columns
+    data = pd.read_csv(
+        RAW_DATA_PATH,
+        usecols=list(RAW_DTYPES),
+        dtype=RAW_DTYPES,
+        engine="pyarrow",
+        dtype_backend="pyarrow",
+    )
+    ref_table = pd.read_csv(REF_TABLE_PATH, engine="pyarrow", dtype_backend="pyarrow")
+
+    # clean relevant numeric columns in `data` and `ref_table`
+    data["Area Code (M49)"] = _clean_intish(data["Area Code (M49)"])
+    ref_table["Numeric code"] = _clean_intish(ref_table["Numeric code"])
+    ref_table["Alpha-3 code"] = ref_table["Alpha-3 code"].astype(str).str.strip(_JUNK)
+
+    # fix inconsistency between raw data and reference table
+    data.loc[data["Area"] == "Sudan", "Area Code (M49)"] = 736
+
+    # shorten a long area name
+    data["Area"] = data["Area"].replace(
+        "United Kingdom of Great Britain and Northern Ireland",
+        "UK and Northern Ireland",
+    )
+
+    # look up each area's ISO-3 code from `ref_table` using its M49 code;
+    # `ref_table` lists several spellings of some countries under the same code,
+    # so keep only one row per code to avoid duplicating rows of `data`
+    code_to_iso = ref_table.drop_duplicates("Numeric code").set_index("Numeric code")[
+        "Alpha-3 code"
     ]
+    data["ISO-3"] = data["Area Code (M49)"].map(code_to_iso)
+
+    # use coco library to tell which continent each area is located in,
+    # converting each distinct M49 code once and mapping the result onto rows
+    # (imported here since it is slow to load and only needed to rebuild the cache)
+    import country_converter as coco
+
+    cc = coco.CountryConverter()
+    logging.getLogger("country_converter").setLevel(logging.ERROR)
+    m49_codes = data["Area Code (M49)"].dropna().unique()
+    code_to_continent = dict(
+        zip(
+            m49_codes,
+            cc.convert(names=list(m49_codes), to="continent", src="UNnumeric"),
+        )
+    )
+    data["Continent"] = (
+        data["Area Code (M49)"].map(code_to_continent).replace("not found", pd.NA)
+    )
+
+    # filter out those area which cannot be matched with a continent
+    # (in place, so the unfiltered frame is not kept alongside a filtered copy)
+    data.dropna(subset=["Continent"], inplace=True)
+    data.reset_index(drop=True, inplace=True)
+    # select only relevant columns in `data` (every value is in tonnes, so the
+    # `Unit` column is dropped along with the codes before deduplicating)
+    data = data[
+        [
+            "Area",
+            "Continent",
+            "ISO-3",
+            "Year",
+            "Import",
+            "Export ",
+            "Production",
+            "Consumption",
+        ]
+    ]
+
+    # rename dirty column names
+    data = data.rename(columns={"Export ": "Export"})
+
+    # store the low-cardinality text columns as categories
+    for column in ("Area", "Continent", "ISO-3"):
+        data[column] = data[column].astype("category")
+
+    # eliminate duplicate rows: keep them as they are if every key is already
+    # unique, otherwise sort by the keys and sum within each group
+    keys = ["Area", "Continent", "ISO-3", "Year"]
+    values = ["Import", "Export", "Production", "Consumption"]
+    if not data.duplicated(subset=keys).any():
+        data = data[keys + values].reset_index(drop=True)
+    else:
+        data = data.sort_values(keys, kind="mergesort")
+        data = data.groupby(keys, observed=True, sort=False, as_index=False).agg(
+            {value: "sum" for value in values}
+        )
+
+    # calculate two derived columns: `Net Trade` and `Self-Sufficiency Ratio`
+    # (the ratio is left as NaN where there is no consumption)
+    production = data["Production"].to_numpy()
+    consumption = data["Consumption"].to_numpy()
+    ratio = np.full(consumption.shape, np.nan)
+    np.divide(production, consumption, out=ratio, where=consumption != 0)
+    data["Net Trade"] = data["Export"].to_numpy() - data["Import"].to_numpy()
+    data["Self-Sufficiency Ratio"] = ratio
+
+    # give every metric its own contiguous float64 buffer and a fresh index,
+    # so later per-column work does not stride through a shared block
+    for column in values + ["Net Trade", "Self-Sufficiency Ratio"]:
+        data[column] = np.ascontiguousarray(data[column].to_numpy(dtype=np.float64))
+    data = data.reset_index(drop=True)
+
+    return data
+
+
+# reuse the cleaned data cached as parquet unless it is missing or older
+# than the raw inputs (or this script), otherwise rebuild and re-cache it
+def _cache_is_fresh() -> bool:
+    if not os.path.exists(CLEAN_DATA_PATH):
+        return False
+    cache_mtime = os.path.getmtime(CLEAN_DATA_PATH)
+    return all(
+        os.path.getmtime(path) <= cache_mtime
+        for path in (RAW_DATA_PATH, REF_TABLE_PATH, __file__)
+    )
+
+
+# write the cache to a temporary file first and move it into place, so that an
+# interrupted write never leaves a truncated cache behind; if the cache cannot
+# be written (e.g. a read-only `data/`), the dashboard runs on the cleaned data
+# in memory
+def _write_cache(data: pd.DataFrame) -> None:
+    tmp_path = CLEAN_DATA_PATH + ".tmp"
+    try:
+        data.to_parquet(tmp_path, compression="zstd", index=False)
+        os.replace(tmp_path, CLEAN_DATA_PATH)
+    except OSError:
+        logging.warning("could not write the data cache %s", CLEAN_DATA_PATH)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# a cache that cannot be read (e.g. corrupt) is rebuilt like a stale one
+def _read_cache() -> pd.DataFrame | None:
+    try:
+        return pd.read_parquet(CLEAN_DATA_PATH)
+    except (OSError, ValueError):
+        logging.warning("could not read the data cache %s", CLEAN_DATA_PATH)
+        return None
+
+
+data = _read_cache() if _cache_is_fresh() else None
+if data is None:
+    data = _build_clean()
+    _write_cache(data)
+
+# metrics that can be selected in Tab 1 and Tab 3
+METRICS = [
+    "Import",
+    "Export",
+    "Production",
+    "Consumption",
+    "Net Trade",
+    "Self-Sufficiency Ratio",
 ]
+# the four trade metrics, the only ones offered in Tab 2 and Tab 4
+TRADE_METRICS = METRICS[:4]
+
+# the continent and ISO-3 code only depend on the area, so keep them in two
+# small lookup tables instead of on every row of `data` (as plain strings:
+# mapping a categorical column onto categorical values mislabels rows)
+areas = data.drop_duplicates("Area")[["Area", "Continent", "ISO-3"]]
+areas = areas.astype(str).set_index("Area")
+AREA_TO_CONTINENT = areas["Continent"]
+AREA_TO_ISO3 = areas["ISO-3"]
+data = data.drop(columns=["Continent", "ISO-3"])
+
+
+# rows of `data` with their continent and ISO-3 code added back after `Area`
+def with_area_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy(deep=False)
+    df.insert(1, "Continent", df["Area"].map(AREA_TO_CONTINENT))
+    df.insert(2, "ISO-3", df["Area"].map(AREA_TO_ISO3))
+    return df
+
+
+# continent of every row of `data`, used while pre-aggregating below and in the
+# continental download (as a category, so grouping and comparing use int codes)
+continents = data["Area"].map(AREA_TO_CONTINENT).astype("category").rename("Continent")
+
+# pre-aggregate the static data once, so that callbacks only need lookups:
+# continental totals per year (a Year x Continent frame for each metric)
+YEAR_CONTINENT = {
+    m: data.groupby(["Year", continents], observed=True)[m].sum().unstack("Continent")
+    for m in METRICS
+}
+# world average per year
+GLOBAL_AVG = {m: data.groupby("Year")[m].mean() for m in METRICS}
+# 3% and 97% quantiles per year, used as the bounds of the world map colour scale
+QUANTILES = {
+    m: data.groupby("Year", sort=False)[m].quantile([0.03, 0.97]).unstack()
+    for m in METRICS
+}
+
+
+# rank of every value among the values of the same year, for all years at once:
+# 1 for the largest, ties share their smallest rank and NaN is left unranked
+# (the same as a per-year rank(method="min", ascending=False))
+def _rank_by_year(values: np.ndarray, years: np.ndarray) -> pd.arrays.IntegerArray:
+    # sort by year, then from largest to smallest value (NaN last)
+    order = np.lexsort((-values, years))
+    sorted_values, sorted_years = values[order], years[order]
+
+    # a rank is the position of the first equal value after the start of its year
+    positions = np.arange(len(values))
+    new_year = np.r_[True, sorted_years[1:] != sorted_years[:-1]]
+    new_value = new_year | np.r_[True, sorted_values[1:] != sorted_values[:-1]]
+    year_start = np.maximum.accumulate(np.where(new_year, positions, 0))
+    value_start = np.maximum.accumulate(np.where(new_value, positions, 0))
 
-# rename dirty column names
-data = data.rename(columns={"Export ": "Export", "Alpha-3 code": "ISO-3"})
+    ranks = np.empty(len(values), dtype=np.int32)
+    ranks[order] = value_start - year_start + 1
+    return pd.arrays.IntegerArray(ranks, np.isnan(values))
 
-# use grouping to eliminate duplicate rows
-data = (
-    data.groupby(["Area", "Continent", "ISO-3", "Year"])
-    .agg({"Import": "sum", "Export": "sum", "Production": "sum", "Consumption": "sum"})
+
+# world rank of every row among all countries in the same year
+years = data["Year"].to_numpy()
+WORLD_RANK = {
+    m: pd.Series(_rank_by_year(data[m].to_numpy(), years), index=data.index)
+    for m in METRICS
+}
+# every country's world rank of each metric per year, offered as a download
+WORLD_RANK_DF = data[["Area", "Year"]].assign(
+    **{f"{m}_Rank": WORLD_RANK[m] for m in METRICS}
+)
+
+# `data` with the world ranks of every metric (as floats, NaN where there is no
+# rank), indexed and sorted by area and year for the line charts of Tab 3
+DATA_INDEXED = (
+    data.assign(**{f"{m}_Rank": WORLD_RANK[m].astype("float64") for m in METRICS})
+    .set_index(["Area", "Year"])
+    .sort_index()
+)
+
+# contents of the three csv downloads, which never change, written only once:
+# all data, the continental totals per year and every country's world ranks
+CSV_FULL = with_area_columns(data).to_csv(index=False)
+CSV_CONT = (
+    data.groupby([continents, "Year"], observed=True)
+    .agg(
+        {
+            "Import": "sum",
+            "Export": "sum",
+            "Production": "sum",
+            "Consumption": "sum",
+        }
+    )
     .reset_index()
+    .to_csv(index=False)
 )
+CSV_RANK = WORLD_RANK_DF.to_csv(index=False)
 
-# calculate two derived columns: `Net Trade` and `Self-Sufficiency Ratio`
-data["Net Trade"] = data["Export"] - data["Import"]
-data["Self-Sufficiency Ratio"] = data["Production"] / data["Consumption"]
+# the same files as they are sent: plain and gzip-compressed bytes
+DOWNLOADS = {
+    name: (csv.encode(), gzip.compress(csv.encode(), mtime=0))
+    for name, csv in (
+        ("map_data.csv", CSV_FULL),
+        ("continental_data.csv", CSV_CONT),
+        ("world_rank_data.csv", CSV_RANK),
+    )
+}
+
+# continents in alphabetical order, and the comparison scopes of Tab 4:
+# each continent or the whole world
+CONTINENTS = sorted(AREA_TO_CONTINENT.unique())
+SCOPES = CONTINENTS + ["the Whole World"]
+
+# top 5 countries (in descending order of the metric, as indices into the sorted
+# area names), their values and market shares for every combination of metric,
+# year and scope, nested as metric -> year -> scope for the clientside callback
+# of Tab 4 (`top5-store`)
+TOP5_CACHE = {m: {} for m in TRADE_METRICS}
+for m in TRADE_METRICS:
+    # rank all rows once per metric: by year, then from the largest value
+    # (ties keep the alphabetical order of `data`, NaN last)
+    ranked = (
+        data[["Area", "Year", m]]
+        .assign(Continent=continents)
+        .take(np.lexsort((-data[m].to_numpy(), years)))
+    )
+    # market total of every year within each scope
+    totals = YEAR_CONTINENT[m].assign(
+        **{"the Whole World": data.groupby("Year", sort=False)[m].sum()}
+    )
+    for scope, rows in [
+        ("the Whole World", ranked),
+        *ranked.groupby("Continent", observed=True, sort=False),
+    ]:
+        # the first 5 rows of every year, still grouped by year, with the market
+        # shares of all of them at once formatted as "12.34%"
+        top5 = rows.groupby("Year", sort=False).head(5)
+        values = top5[m].to_numpy()
+        shares = np.char.mod(
+            "%.2f%%", values / totals[scope].reindex(top5["Year"]).to_numpy() * 100
+        )
+        index = top5["Area"].cat.codes.tolist()
+        values, shares = values.tolist(), shares.tolist()
+        top5_years, starts = np.unique(top5["Year"].to_numpy(), return_index=True)
+        for year, start, end in zip(top5_years, starts, [*starts[1:], len(index)]):
+            TOP5_CACHE[m].setdefault(int(year), {})[scope] = {
+                "index": index[start:end],
+                "values": values[start:end],
+                "shares": shares[start:end],
+            }
 
 # load dashboard theme
 dbc_css = "https://cdn.jsdelivr.net/gh/AnnMarieW/dash-bootstrap-templates/dbc.min.css"
 load_figure_template("CERULEAN")
 
+# every figure title is centred above its plot
+CENTER_TITLE = dict(xanchor="center", yanchor="top", x=0.5)
+
+
+# a centred figure title with the given text
+def centered_title(text: str) -> dict:
+    return dict(text=text, **CENTER_TITLE)
+
+
+# the theme's figure template, sent to the browser once (`figure-template`) and
+# added back to the base layouts of the clientside figures in `assets/spice.js`
+FIGURE_TEMPLATE = go.Figure().layout.template.to_plotly_json()
+
+
+# the layout of a figure without its template, as a base layout of a store
+def base_layout(fig: go.Figure) -> dict:
+    layout = fig.to_plotly_json()["layout"]
+    layout.pop("template", None)
+    return layout
+
+
+# everything the clientside world map of Tab 1 needs (see `assets/spice.js`):
+# every area's name and ISO-3 code once, then the rows of each year as indices
+# into those lists with their values, the colour scale bounds of each metric
+# per year and a base layout, so that picking a metric or year never goes
+# through the server
+MAP_STORE = {
+    "areas": data["Area"].cat.categories.tolist(),
+    "iso3": AREA_TO_ISO3[data["Area"].cat.categories].tolist(),
+    "rows": {
+        int(year): {
+            "index": rows["Area"].cat.codes.tolist(),
+            **{m: rows[m].tolist() for m in METRICS},
+        }
+        for year, rows in data.groupby("Year", sort=False)
+    },
+    "bounds": {
+        m: dict(zip(QUANTILES[m].index.tolist(), QUANTILES[m].to_numpy().tolist()))
+        for m in METRICS
+    },
+    "layout": base_layout(
+        go.Figure()
+        .update_geos(fitbounds="locations")
+        .update_layout(
+            margin={"r": 0, "t": 40, "l": 0, "b": 100},
+            coloraxis=dict(
+                colorscale=go.Figure().layout.template.layout.colorscale.sequential,
+                colorbar=dict(
+                    orientation="h", xanchor="center", yanchor="top", x=0.5, y=-0.15
+                ),
+            ),
+            title=CENTER_TITLE,
+        )
+    ),
+}
+
+# what the clientside hover bar chart of Tab 2 needs (see `assets/spice.js`): the
+# continental totals of every trade metric per year and a base layout of the chart
+CONTINENT_STORE = {
+    "continents": CONTINENTS,
+    "totals": {
+        m: dict(
+            zip(
+                YEAR_CONTINENT[m].index.tolist(),
+                YEAR_CONTINENT[m][CONTINENTS].to_numpy().tolist(),
+            )
+        )
+        for m in TRADE_METRICS
+    },
+    "layout": base_layout(
+        go.Figure().update_layout(
+            yaxis=dict(
+                title_text="Continent",
+                categoryorder="array",
+                categoryarray=CONTINENTS[::-1],
+            ),
+            legend=dict(title_text="Continent", tracegroupgap=0),
+            margin={"t": 60},
+            barmode="relative",
+            title=CENTER_TITLE,
+        )
+    ),
+}
+
+# what the clientside callback of Tab 4 needs (see `assets/spice.js`): the area
+# names once, the top 5 countries of every metric, year and scope and a base
+# layout of the bar chart
+TOP5_STORE = {
+    "areas": data["Area"].cat.categories.tolist(),
+    "top5": TOP5_CACHE,
+    "layout": base_layout(
+        go.Figure().update_layout(
+            margin={"t": 60}, barmode="relative", yaxis_title_text="Area"
+        )
+    ),
+}
+
 # create an app object
 app = Dash(__name__, external_stylesheets=[dbc.themes.CERULEAN, dbc_css])
 
@@ -106,9 +466,16 @@ card_style = {
     "textAlign": "center",
 }
 
+# dropdown options and input bounds used across the layout
+YEARS = sorted(data["Year"].unique().tolist())
+YEAR_MIN, YEAR_MAX = YEARS[0], YEARS[-1]
+AREAS = data["Area"].cat.categories.tolist()
+
 # design the app layout
 app.layout = dbc.Container(
     [
+        # the figure template shared by the clientside figures of every tab
+        dcc.Store(id="figure-template", data=FIGURE_TEMPLATE),
         dcc.Tabs(
             id="tabs",
             children=[
@@ -148,14 +515,7 @@ app.layout = dbc.Container(
                                                     dbc.Row(
                                                         dcc.Dropdown(
                                                             id="metric-picker",
-                                                            options=[
-                                                                "Import",
-                                                                "Export",
-                                                                "Production",
-                                                                "Consumption",
-                                                                "Net Trade",
-                                                                "Self-Sufficiency Ratio",
-                                                            ],
+                                                            options=METRICS,
                                                             value="Import",
                                                         )
                                                     ),
@@ -173,10 +533,8 @@ app.layout = dbc.Container(
                                                     dbc.Row(
                                                         dcc.Dropdown(
                                                             id="year-picker",
-                                                            options=data[
-                                                                "Year"
-                                                            ].unique(),
-                                                            value=data["Year"].max(),
+                                                            options=YEARS,
+                                                            value=YEAR_MAX,
                                                         )
                                                     ),
                                                 ],
@@ -186,14 +544,14 @@ app.layout = dbc.Container(
                                         # A button to download raw data
                                         dbc.Row(
                                             html.Div(
-                                                [
-                                                    html.Button(
-                                                        "Download All Data",
-                                                        id="btn-download1",
-                                                        className="btn btn-primary",
+                                                html.A(
+                                                    "Download All Data",
+                                                    href=app.get_relative_path(
+                                                        "/download/map_data.csv"
                                                     ),
-                                                    dcc.Download(id="download-csv1"),
-                                                ]
+                                                    download="map_data.csv",
+                                                    className="btn btn-primary",
+                                                )
                                             ),
                                             className="h-100",
                                         ),
@@ -204,7 +562,11 @@ app.layout = dbc.Container(
                                 # Middle column: World Map of the selected metric in selected year
                                 dbc.Col(
                                     dbc.Card(
-                                        dcc.Graph(id="global-map"), className="h-100"
+                                        [
+                                            dcc.Graph(id="global-map"),
+                                            dcc.Store(id="spice-store", data=MAP_STORE),
+                                        ],
+                                        className="h-100",
                                     ),
                                     className="h-100",
                                 ),
@@ -259,12 +621,7 @@ app.layout = dbc.Container(
                                                     dbc.Row(
                                                         dcc.Dropdown(
                                                             id="metric-picker-2",
-                                                            options=[
-                                                                "Import",
-                                                                "Export",
-                                                                "Production",
-                                                                "Consumption",
-                                                            ],
+                                                            options=TRADE_METRICS,
                                                             value="Import",
                                                         )
                                                     ),
@@ -275,14 +632,14 @@ app.layout = dbc.Container(
                                         # A button to download continental (wrangled) data
                                         dbc.Row(
                                             html.Div(
-                                                [
-                                                    html.Button(
-                                                        "Download Continental Data",
-                                                        id="btn-download2",
-                                                        className="btn btn-primary",
+                                                html.A(
+                                                    "Download Continental Data",
+                                                    href=app.get_relative_path(
+                                                        "/download/continental_data.csv"
                                                     ),
-                                                    dcc.Download(id="download-csv2"),
-                                                ]
+                                                    download="continental_data.csv",
+                                                    className="btn btn-primary",
+                                                )
                                             ),
                                             className="h-100",
                                         ),
@@ -303,7 +660,13 @@ app.layout = dbc.Container(
                                 # in the hovered year
                                 dbc.Col(
                                     dbc.Card(
-                                        dcc.Graph(id="continent-bar-chart"),
+                                        [
+                                            dcc.Graph(id="continent-bar-chart"),
+                                            dcc.Store(
+                                                id="continent-agg-store",
+                                                data=CONTINENT_STORE,
+                                            ),
+                                        ],
                                         className="h-100",
                                     ),
                                     className="h-100",
@@ -352,9 +715,7 @@ app.layout = dbc.Container(
                                                     dbc.Row(
                                                         dcc.Dropdown(
                                                             id="country-picker",
-                                                            options=data[
-                                                                "Area"
-                                                            ].unique(),
+                                                            options=AREAS,
                                                             multi=True,
                                                         )
                                                     ),
@@ -372,14 +733,7 @@ app.layout = dbc.Container(
                                                     dbc.Row(
                                                         dcc.Dropdown(
                                                             id="metric-picker-3",
-                                                            options=[
-                                                                "Import",
-                                                                "Export",
-                                                                "Production",
-                                                                "Consumption",
-                                                                "Net Trade",
-                                                                "Self-Sufficiency Ratio",
-                                                            ],
+                                                            options=METRICS,
                                                             value="Import",
                                                         )
                                                     ),
@@ -402,15 +756,10 @@ app.layout = dbc.Container(
                                                                 dcc.Input(
                                                                     id="start-year",
                                                                     type="number",
-                                                                    min=data[
-                                                                        "Year"
-                                                                    ].min(),
-                                                                    max=data[
-                                                                        "Year"
-                                                                    ].max()
-                                                                    - 1,
+                                                                    min=YEAR_MIN,
+                                                                    max=YEAR_MAX - 1,
                                                                     step=1,
-                                                                    value=1993,
+                                                                    value=YEAR_MIN,
                                                                     placeholder="Start Year",
                                                                     className="form-control",
                                                                 )
@@ -419,12 +768,10 @@ app.layout = dbc.Container(
                                                                 dcc.Input(
                                                                     id="end-year",
                                                                     type="number",
-                                                                    min=1994,
-                                                                    max=data[
-                                                                        "Year"
-                                                                    ].max(),
+                                                                    min=YEAR_MIN + 1,
+                                                                    max=YEAR_MAX,
                                                                     step=1,
-                                                                    value=2023,
+                                                                    value=YEAR_MAX,
                                                                     placeholder="End Year",
                                                                     className="form-control",
                                                                 )
@@ -449,14 +796,14 @@ app.layout = dbc.Container(
                                         # A button to download world rank data
                                         dbc.Row(
                                             html.Div(
-                                                [
-                                                    html.Button(
-                                                        "Download World Rank Data",
-                                                        id="btn-download3",
-                                                        className="btn btn-primary",
+                                                html.A(
+                                                    "Download World Rank Data",
+                                                    href=app.get_relative_path(
+                                                        "/download/world_rank_data.csv"
                                                     ),
-                                                    dcc.Download(id="download-csv3"),
-                                                ]
+                                                    download="world_rank_data.csv",
+                                                    className="btn btn-primary",
+                                                )
                                             ),
                                             className="h-100",
                                         ),
@@ -513,12 +860,7 @@ app.layout = dbc.Container(
                                                     dbc.Row(
                                                         dcc.Dropdown(
                                                             id="metric-picker-4",
-                                                            options=[
-                                                                "Import",
-                                                                "Export",
-                                                                "Production",
-                                                                "Consumption",
-                                                            ],
+                                                            options=TRADE_METRICS,
                                                             value="Import",
                                                         )
                                                     ),
@@ -536,10 +878,8 @@ app.layout = dbc.Container(
                                                     dbc.Row(
                                                         dcc.Dropdown(
                                                             id="year-picker-2",
-                                                            options=data[
-                                                                "Year"
-                                                            ].unique(),
-                                                            value=data["Year"].max(),
+                                                            options=YEARS,
+                                                            value=YEAR_MAX,
                                                         )
                                                     ),
                                                 ],
@@ -558,14 +898,7 @@ app.layout = dbc.Container(
                                                     dbc.Row(
                                                         dcc.Dropdown(
                                                             id="scope-picker",
-                                                            options=[
-                                                                "Africa",
-                                                                "America",
-                                                                "Asia",
-                                                                "Europe",
-                                                                "Oceania",
-                                                                "the Whole World",
-                                                            ],
+                                                            options=SCOPES,
                                                             value="the Whole World",
                                                         )
                                                     ),
@@ -581,7 +914,10 @@ app.layout = dbc.Container(
                                 # the selected metric in selected year within the selected scope
                                 dbc.Col(
                                     dbc.Card(
-                                        dcc.Graph(id="top5-bar-chart"),
+                                        [
+                                            dcc.Graph(id="top5-bar-chart"),
+                                            dcc.Store(id="top5-store", data=TOP5_STORE),
+                                        ],
                                         className="h-100",
                                     ),
                                     className="h-100",
@@ -676,23 +1012,45 @@ app.layout = dbc.Container(
                     ],
                 ),
             ],
-        )
+        ),
     ]
 )
 
 
+# Tab 1 visualization 2: Global Average time series of the selected metric
+# (built once per metric and kept as a plain figure dict)
+@lru_cache(maxsize=None)
+def _global_time_series(metric):
+    average = GLOBAL_AVG[metric]
+    return (
+        go.Figure(
+            go.Scatter(
+                x=average.index.to_numpy(),
+                y=average.to_numpy(),
+                mode="lines",
+                name="",
+                showlegend=False,
+                hovertemplate=f"Year=%{{x}}<br>{metric}=%{{y}}<extra></extra>",
+            )
+        )
+        .update_layout(
+            xaxis_title_text="Year",
+            yaxis_title_text=f"World Average {metric}",
+            margin={"t": 60},
+            title=centered_title(f"World Average of Spice {metric} across years"),
+        )
+        .to_dict()
+    )
+
+
 # Call back function of Tab 1
 @app.callback(
     Output("global-title", "children"),
     Output("description", "children"),
-    Output("global-map", "figure"),
     Output("global-time-series", "figure"),
-    Output("download-csv1", "data"),
     Input("metric-picker", "value"),
-    Input("year-picker", "value"),
-    Input("btn-download1", "n_clicks"),
 )
-def global_overview_plots(metric, year, n_clicks):
+def global_overview_plots(metric):
 
     # Title of Tab 1
     title = f"Global Overview of Spice {metric}"
@@ -708,74 +1066,77 @@ def global_overview_plots(metric, year, n_clicks):
 
     The data used ranges from 1993 to 2023."""
 
-    # Tab 1 visualization 1: World Map of the selected metric in selected year
-    global_map = (
-        px.choropleth(
-            (data[data["Year"] == year].sort_values("Year")),
-            locations="ISO-3",
-            color=metric,
-            animation_frame="Year",
-            locationmode="ISO-3",
-            hover_data={"Area": True, metric: True, "Year": True, "ISO-3": False},
-        )
-        .update_geos(fitbounds="locations")
-        .update_layout(
-            margin={"r": 0, "t": 40, "l": 0, "b": 100}, coloraxis_colorbar_x=0.85
-        )
-        .update_layout(
-            coloraxis=dict(
-                cmin=data[data["Year"] == year][metric].quantile(0.03),
-                cmax=data[data["Year"] == year][metric].quantile(0.97),
-                colorbar=dict(
-                    orientation="h", xanchor="center", yanchor="top", x=0.5, y=-0.15
+    # Tab 1 visualization 2: Global Average time series of the selected metric
+    global_time_series = _global_time_series(metric)
+
+    return title, description, global_time_series
+
+
+# Tab 1 visualization 1: World Map of the selected metric in selected year,
+# drawn in the browser from `spice-store` (see `update_global_map` in `assets/spice.js`)
+clientside_callback(
+    ClientsideFunction(namespace="spice", function_name="update_global_map"),
+    Output("global-map", "figure"),
+    Input("metric-picker", "value"),
+    Input("year-picker", "value"),
+    State("spice-store", "data"),
+    State("figure-template", "data"),
+)
+
+
+# Tab 2 visualization 1: Stacked area chart showing continental percentage
+# compared to world total (built once per metric and kept as a plain figure dict)
+@lru_cache(maxsize=None)
+def _continent_stacked_area(metric):
+
+    # Continental totals of the selected metric per year, one column per continent
+    totals = YEAR_CONTINENT[metric]
+
+    # one stacked trace per continent, normalised to percentages of each year
+    traces = []
+    for continent in CONTINENTS:
+        values = totals[continent].dropna()
+        traces.append(
+            go.Scatter(
+                x=values.index.to_numpy(),
+                y=values.to_numpy(),
+                name=continent,
+                legendgroup=continent,
+                mode="lines",
+                stackgroup="1",
+                groupnorm="percent",
+                hovertemplate=(
+                    "Continent: %{fullData.name}<br>"
+                    "Year: %{x}<br>"
+                    "Percentage: %{y:.2f}%<extra></extra>"
                 ),
-            ),
-            title=dict(
-                text=f"World Map of Spice {metric} in {year}",
-                xanchor="center",
-                yanchor="top",
-                x=0.5,
-            ),
+            )
         )
-    )
 
-    # Tab 1 visualization 2: Global Average time series of the selected metric
-    global_time_series = (
-        px.line(
-            (data.groupby("Year")[metric].mean().to_frame().reset_index()),
-            x="Year",
-            y=metric,
-        )
+    return (
+        go.Figure(traces)
         .update_layout(
-            title=dict(
-                text=f"World Average of Spice {metric} across years",
-                xanchor="center",
-                yanchor="top",
-                x=0.5,
-            )
+            xaxis_title_text="Year",
+            yaxis_title_text=f"Percentage of World Total Spice {metric}",
+            legend=dict(title_text="Continent", tracegroupgap=0),
+            margin={"t": 60},
+            title=centered_title(
+                f"Continental Percentage of World Total <br>"
+                f"Spice {metric} across years"
+            ),
         )
-        .update_yaxes(title_text=f"World Average {metric}")
+        .to_dict()
     )
 
-    # The button to download all data
-    if ctx.triggered_id == "btn-download1":
-        download_df = dcc.send_data_frame(data.to_csv, "map_data.csv", index=False)
-    else:
-        download_df = no_update
-
-    return title, description, global_map, global_time_series, download_df
-
 
 # First call back function of Tab 2
 @app.callback(
     Output("continent-title", "children"),
     Output("description2", "children"),
     Output("continent-stacked-area", "figure"),
-    Output("download-csv2", "data"),
     Input("metric-picker-2", "value"),
-    Input("btn-download2", "n_clicks"),
 )
-def continent_analysis_plots(metric, n_clicks):
+def continent_analysis_plots(metric):
 
     # Title of Tab 2
     title = f"Continental Analysis of Spice {metric}"
@@ -788,91 +1149,82 @@ def continent_analysis_plots(metric, n_clicks):
     the raw values of the selected spice metric for that hovered year
     across all five continents will appear as a bar chart in the second plot."""
 
-    # Processed data frame for plotting
-    plot_df = data.groupby(["Continent", "Year"]).agg({metric: "sum"}).reset_index()
-
     # Tab 2 visualization 1: Stacked area chart showing continental percentage compared to world total
-    continent_stacked_area = (
-        px.area(plot_df, x="Year", y=metric, color="Continent", groupnorm="percent")
-        .update_layout(
-            title=dict(
-                text=(
-                    f"Continental Percentage of World Total <br>"
-                    f"Spice {metric} across years"
-                ),
-                xanchor="center",
-                yanchor="top",
-                x=0.5,
-            )
-        )
-        .update_yaxes(title_text=f"Percentage of World Total Spice {metric}")
-        .update_traces(
-            hovertemplate=(
-                "Continent: %{fullData.name}<br>"
-                "Year: %{x}<br>"
-                "Percentage: %{y:.2f}%<extra></extra>"
-            )
-        )
-    )
+    continent_stacked_area = _continent_stacked_area(metric)
 
-    # Prepare dataframe to download
-    continental_df = (
-        data.groupby(["Continent", "Year"])
-        .agg(
-            {
-                "Import": "sum",
-                "Export": "sum",
-                "Production": "sum",
-                "Consumption": "sum",
-            }
-        )
-        .reset_index()
-    )
+    return title, description2, continent_stacked_area
 
-    # A button to download continental data
-    if ctx.triggered_id == "btn-download2":
-        download_df = dcc.send_data_frame(
-            continental_df.to_csv, "continental_data.csv", index=False
-        )
-    else:
-        download_df = no_update
 
-    return title, description2, continent_stacked_area, download_df
-
-
-# Second call back function of Tab 2 (Cross-Filtering)
-@app.callback(
+# Second call back function of Tab 2 (Cross-Filtering), run in the browser on
+# every hover from `continent-agg-store` (see `update_continent_bar_chart` in
+# `assets/spice.js`)
+clientside_callback(
+    ClientsideFunction(namespace="spice", function_name="update_continent_bar_chart"),
     Output("continent-bar-chart", "figure"),
     Input("metric-picker-2", "value"),
     Input("continent-stacked-area", "hoverData"),
+    State("continent-agg-store", "data"),
+    State("figure-template", "data"),
 )
-def continent_analysis_plots2(metric, hoverData):
-
-    # No updates on the second chart if there is no hover data
-    if hoverData is None:
-        raise PreventUpdate
-
-    # Processed data frame for plotting
-    plot_df = data.groupby(["Continent", "Year"]).agg({metric: "sum"}).reset_index()
-
-    # Tab 2 visualization 2: Bar chart showing continental total of
-    # the selected metric in the hovered year
-    continent_bar_chart = px.bar(
-        plot_df[plot_df["Year"] == hoverData["points"][0]["x"]],
-        x=metric,
-        y="Continent",
-        color="Continent",
-        opacity=0.6,
-    ).update_layout(
-        title=dict(
-            text=f"Total Spice {metric} in each continent in {hoverData['points'][0]['x']}",
-            xanchor="center",
-            yanchor="top",
-            x=0.5,
+
+
+# one line per selected country (in alphabetical order, skipping countries
+# without rows in these years) of a column of `DATA_INDEXED` between two years
+def _country_lines(countries, column, label, start_year, end_year):
+    areas = [area for area in countries if area in AREA_TO_CONTINENT.index]
+    subset = DATA_INDEXED.loc[(areas, slice(start_year, end_year)), column]
+    return [
+        go.Scattergl(
+            x=rows.index.get_level_values("Year").to_numpy(),
+            y=rows.to_numpy(),
+            name=area,
+            legendgroup=area,
+            showlegend=True,
+            mode="lines",
+            hovertemplate=(
+                f"Area={area}<br>Year=%{{x}}<br>{label}=%{{y}}<extra></extra>"
+            ),
         )
+        for area, rows in subset.groupby(level="Area", observed=True)
+    ]
+
+
+# Tab 3 visualizations 1 and 2 for a selection of countries, metric and years,
+# kept as plain figure dicts for the most recent selections
+@lru_cache(maxsize=256)
+def _country_level_figures(countries, metric, start_year, end_year):
+
+    # Tab 3 visualization 1: Time series plot of the selected countries
+    # between selected years in terms of selected metric
+    country_time_series = go.Figure(
+        _country_lines(countries, metric, metric, start_year, end_year)
+    ).update_layout(
+        xaxis_title_text="Year",
+        yaxis_title_text=metric,
+        legend=dict(title_text="Area", tracegroupgap=0),
+        margin={"t": 60},
+        title=centered_title(
+            f"Spice {metric} of selected countries <br>"
+            f"between {start_year} and {end_year}"
+        ),
+    )
+
+    # Tab 3 visualization 2: Time series plot of the selected countries
+    # between selected years in terms of the country's world rank of this metric
+    country_world_rank = go.Figure(
+        _country_lines(countries, f"{metric}_Rank", "world_rank", start_year, end_year)
+    ).update_layout(
+        xaxis_title_text="Year",
+        yaxis_title_text=f"World Rank of Spice {metric}",
+        legend=dict(title_text="Area", tracegroupgap=0),
+        margin={"t": 60},
+        title=centered_title(
+            f"Country's World Rank of Spice {metric} <br>"
+            f"between {start_year} and {end_year}"
+        ),
     )
 
-    return continent_bar_chart
+    return country_time_series.to_dict(), country_world_rank.to_dict()
 
 
 # Call back function of Tab 3
@@ -882,14 +1234,12 @@ def continent_analysis_plots2(metric, hoverData):
     Output("country-time-series", "figure"),
     Output("country-world-rank", "figure"),
     Output("year-warning", "children"),
-    Output("download-csv3", "data"),
     Input("country-picker", "value"),
     Input("metric-picker-3", "value"),
     Input("start-year", "value"),
     Input("end-year", "value"),
-    Input("btn-download3", "n_clicks"),
 )
-def country_level_plots(countries, metric, start_year, end_year, n_clicks):
+def country_level_plots(countries, metric, start_year, end_year):
 
     # Title of Tab 3
     title = f"Country-level Deep Dive of Spice {metric}"
@@ -907,82 +1257,18 @@ def country_level_plots(countries, metric, start_year, end_year, n_clicks):
     empty_fig = {}
     warning = ""
 
-    # Prepare world rank dataframe to download later
-    world_rank_data = data.copy()
-    metrics = [
-        "Import",
-        "Export",
-        "Production",
-        "Consumption",
-        "Net Trade",
-        "Self-Sufficiency Ratio",
-    ]
-    for metric in metrics:
-        world_rank_data[metric + "_Rank"] = (
-            world_rank_data.groupby("Year")[metric]
-            .rank(method="min", ascending=False)
-            .astype("Int64")
-        )
-    world_rank_data = world_rank_data[["Area", "Year"] + [m + "_Rank" for m in metrics]]
-
-    # A button to download world rank data
-    if ctx.triggered_id == "btn-download3":
-        download_df = dcc.send_data_frame(
-            world_rank_data.to_csv, "world_rank_data.csv", index=False
-        )
-    else:
-        download_df = no_update
-
     # No updates on both charts if countries are not selected
     if countries is None or start_year is None or end_year is None:
-        return title, description3, empty_fig, empty_fig, warning, download_df
+        return title, description3, empty_fig, empty_fig, warning
 
     # Outputs a warning message if end year is earlier than start year
     if end_year <= start_year:
         warning = "End year must be greater than start year."
-        return title, description3, empty_fig, empty_fig, warning, download_df
+        return title, description3, empty_fig, empty_fig, warning
 
-    # Tab 3 visualization 1: Time series plot of the selected countries
-    # between selected years in terms of selected metric
-    cond = (data["Area"].isin(countries)) & (
-        data["Year"].isin(range(start_year, end_year + 1))
-    )
-    country_time_series = px.line(
-        data[cond], x="Year", y=metric, color="Area"
-    ).update_layout(
-        title=dict(
-            text=(
-                f"Spice {metric} of selected countries <br>"
-                f"between {start_year} and {end_year}"
-            ),
-            xanchor="center",
-            yanchor="top",
-            x=0.5,
-        )
-    )
-
-    # Tab 3 visualization 2: Time series plot of the selected countries
-    # between selected years in terms of the country's world rank of this metric
-    data_with_world_rank = data.copy()
-    data_with_world_rank["world_rank"] = (
-        data_with_world_rank.groupby(["Year"])[metric]
-        .rank(method="min", ascending=False)
-        .astype("Int64")
-    )
-    country_world_rank = (
-        px.line(data_with_world_rank[cond], x="Year", y="world_rank", color="Area")
-        .update_layout(
-            title=dict(
-                text=(
-                    f"Country's World Rank of Spice {metric} <br>"
-                    f"between {start_year} and {end_year}"
-                ),
-                xanchor="center",
-                yanchor="top",
-                x=0.5,
-            )
-        )
-        .update_yaxes(title_text=f"World Rank of Spice {metric}")
+    # Tab 3 visualizations, cached per selection
+    country_time_series, country_world_rank = _country_level_figures(
+        tuple(countries), metric, start_year, end_year
     )
 
     return (
@@ -991,12 +1277,13 @@ def country_level_plots(countries, metric, start_year, end_year, n_clicks):
         country_time_series,
         country_world_rank,
         warning,
-        download_df,
     )
 
 
-# Call back function of Tab 4
-@app.callback(
+# Call back function of Tab 4, run in the browser from `top5-store`
+# (see `update_top5` in `assets/spice.js`)
+clientside_callback(
+    ClientsideFunction(namespace="spice", function_name="update_top5"),
     Output("top5-title", "children"),
     Output("top5-bar-chart", "figure"),
     Output("market-share-title", "children"),
@@ -1014,66 +1301,26 @@ def country_level_plots(countries, metric, start_year, end_year, n_clicks):
     Input("metric-picker-4", "value"),
     Input("year-picker-2", "value"),
     Input("scope-picker", "value"),
+    State("top5-store", "data"),
+    State("figure-template", "data"),
 )
-def top5_plot_and_table(metric, year, scope):
 
-    # Title of Tab 4
-    top5_title = f"Top 5 countries of {metric} in {year} within {scope}"
 
-    # Get the data frame used for plotting
-    # and calculate the market total
-    if scope == "the Whole World":
-        plot_df = (
-            data[data["Year"] == year].sort_values(metric, ascending=False).iloc[:5, :]
-        )
-        market_total = data[data["Year"] == year][metric].sum()
-
-    else:
-        plot_df = (
-            data[(data["Year"] == year) & (data["Continent"] == scope)]
-            .sort_values(metric, ascending=False)
-            .iloc[:5, :]
-        )
-        market_total = data[(data["Year"] == year) & (data["Continent"] == scope)][
-            metric
-        ].sum()
-
-    # Tab 4 visualization 1: Bar chart
-    top5_bar_chart = px.bar(
-        plot_df.sort_values(metric, ascending=True), x=metric, y="Area"
-    )
-
-    # Tab 4 summary table: market share
-    market_share_title = f"Market Share of {metric} of these 5 countries"
-    top1_country_name = plot_df["Area"].iloc[0]
-    top2_country_name = plot_df["Area"].iloc[1]
-    top3_country_name = plot_df["Area"].iloc[2]
-    top4_country_name = plot_df["Area"].iloc[3]
-    top5_country_name = plot_df["Area"].iloc[4]
-
-    column_name_market_share = f"{metric} Market Share"
-    top1_market_share = f"{plot_df[metric].iloc[0] / market_total * 100:.2f}%"
-    top2_market_share = f"{plot_df[metric].iloc[1] / market_total * 100:.2f}%"
-    top3_market_share = f"{plot_df[metric].iloc[2] / market_total * 100:.2f}%"
-    top4_market_share = f"{plot_df[metric].iloc[3] / market_total * 100:.2f}%"
-    top5_market_share = f"{plot_df[metric].iloc[4] / market_total * 100:.2f}%"
-
-    return (
-        top5_title,
-        top5_bar_chart,
-        market_share_title,
-        top1_country_name,
-        top2_country_name,
-        top3_country_name,
-        top4_country_name,
-        top5_country_name,
-        column_name_market_share,
-        top1_market_share,
-        top2_market_share,
-        top3_market_share,
-        top4_market_share,
-        top5_market_share,
-    )
+# Downloads of all three tabs, served directly by the flask server instead of
+# a callback (gzip-compressed unless the browser does not accept it)
+@app.server.route(app.config.routes_pathname_prefix + "download/<name>")
+def download_csv(name):
+    if name not in DOWNLOADS:
+        abort(404)
+    plain, compressed = DOWNLOADS[name]
+    headers = {
+        "Content-Disposition": f'attachment; filename="{name}"',
+        "Vary": "Accept-Encoding",
+    }
+    if request.accept_encodings["gzip"]:
+        headers["Content-Encoding"] = "gzip"
+        return Response(compressed, mimetype="text/csv", headers=headers)
+    return Response(plain, mimetype="text/csv", headers=headers)
 
 
 if __name__ == "__main__":